@@ -1,29 +1,93 @@
-import requests
+import aiosqlite
+import httpx
 import asyncio
+import atexit
 import os
-import sqlite3
+import queue
+import sys
+import time
 from telethon import Button, TelegramClient, events
 from telethon.errors import (
+    FloodWaitError,
     SessionPasswordNeededError,
     RPCError,
     UsernameNotOccupiedError,
     PeerIdInvalidError
 )
+from telethon.network import ConnectionTcpAbridged
 from telethon.tl.types import Channel, User
+from telethon.utils import get_peer_id
 from dotenv import load_dotenv
 import re
 import html  # For escaping HTML characters
 import logging
-from logging.handlers import RotatingFileHandler
+from collections import OrderedDict
+from functools import partial
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+try:
+    import re2 as regex_engine  # google-re2: linear-time DFA matching
+except ImportError:
+    regex_engine = re
+
+try:
+    import cryptg
+except ImportError:
+    cryptg = None
 
 # -----------------------------
 # 1. Configure Logging with Log Rotation
 # -----------------------------
+LOG_BUFFER_SIZE = 64 * 1024  # bytes
+LOG_FLUSH_INTERVAL = 30  # seconds
+
+class SizeTrackingRotatingFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler that keeps a running count of the bytes written
+    instead of seeking to the end of the file on every emit to decide
+    whether to roll over. Writes are buffered; only WARNING and above are
+    flushed immediately, the rest by flush_logs_periodically().
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        try:
+            self._bytes_written = os.path.getsize(self.baseFilename)
+        except OSError:
+            self._bytes_written = 0
+
+    def _open(self):
+        return open(
+            self.baseFilename,
+            self.mode,
+            buffering=LOG_BUFFER_SIZE,
+            encoding=self.encoding,
+            errors=self.errors
+        )
+
+    def emit(self, record):
+        try:
+            msg = self.format(record) + self.terminator
+            # Count encoded bytes: every record has multi-byte emoji, so len(msg) runs low
+            size = len(msg.encode(self.encoding or 'utf-8', self.errors or 'strict'))
+            if self.maxBytes > 0 and self._bytes_written + size >= self.maxBytes:
+                self.doRollover()
+                self._bytes_written = 0
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(msg)
+            self._bytes_written += size
+            if record.levelno >= logging.WARNING:
+                self.flush()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)  # Change to DEBUG for more detailed logs
 
 os.makedirs("logs", exist_ok=True)
-handler = RotatingFileHandler(
+handler = SizeTrackingRotatingFileHandler(
     os.path.join("logs", "telegram_monitor_text_only.log"),
     maxBytes=5 * 1024 * 1024,  # 5 MB
     backupCount=5,
@@ -31,11 +95,25 @@ handler = RotatingFileHandler(
 )
 formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
 handler.setFormatter(formatter)
-logger.addHandler(handler)
 
 stream_handler = logging.StreamHandler()
 stream_handler.setFormatter(formatter)
-logger.addHandler(stream_handler)
+
+# The event loop only enqueues records; a listener thread does the actual I/O
+log_queue = queue.Queue(-1)
+logger.addHandler(QueueHandler(log_queue))
+log_listener = QueueListener(log_queue, handler, stream_handler)
+log_listener.start()
+atexit.register(log_listener.stop)  # Drains queued records on exit
+
+async def flush_logs_periodically():
+    """
+    Flushes the buffered log file every LOG_FLUSH_INTERVAL seconds. The flush
+    runs in a worker thread so the write (and the handler lock) stay off the loop.
+    """
+    while True:
+        await asyncio.sleep(LOG_FLUSH_INTERVAL)
+        await asyncio.to_thread(handler.flush)
 
 # -----------------------------
 # 2. Load Environment Variables
@@ -46,8 +124,9 @@ API_ID = os.getenv('TELEGRAM_API_ID')
 API_HASH = os.getenv('TELEGRAM_API_HASH')
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 TARGET_CHANNELS = os.getenv('TARGET_CHANNELS')  # Comma-separated list of channels
+GOLD_API_KEY = os.getenv('GOLD_API_KEY')
 
-if not all([API_ID, API_HASH, BOT_TOKEN, TARGET_CHANNELS]):
+if not all([API_ID, API_HASH, BOT_TOKEN, TARGET_CHANNELS, GOLD_API_KEY]):
     logger.error("❌ One or more required environment variables are missing. Check your .env file.")
     exit(1)
 
@@ -58,71 +137,119 @@ TARGET_CHANNELS = [ch.strip() for ch in TARGET_CHANNELS.split(',') if ch.strip()
 # -----------------------------
 DB_FILE = "subscribers.db"
 
-def init_db():
+# One long-lived aiosqlite connection (opened by init_db() in main()). Queries run on
+# aiosqlite's worker thread, so they never block the event loop.
+_db = None
+
+# In-memory mirror of subscribed_users, loaded in main(); SQLite remains the persistence layer
+SUBSCRIBERS = set()
+# Held across each DB write and its SUBSCRIBERS update so the two can't diverge
+_db_write_lock = asyncio.Lock()
+
+async def _connect():
+    """
+    Opens an autocommit connection to DB_FILE with the tuning PRAGMAs applied.
+    synchronous, temp_store and cache_size are per-connection settings, so any
+    new connection must go through here.
+    """
+    conn = await aiosqlite.connect(DB_FILE, isolation_level=None)
+    await conn.execute("PRAGMA journal_mode=WAL")
+    await conn.execute("PRAGMA synchronous=NORMAL")
+    await conn.execute("PRAGMA temp_store=MEMORY")
+    await conn.execute("PRAGMA cache_size=-64000")  # ~64 MB page cache
+    return conn
+
+async def init_db():
     """
-    Creates the necessary table if it doesn't exist 
-    to store subscribed user IDs.
+    Opens the database connection and creates the necessary table
+    if it doesn't exist to store subscribed user IDs.
     """
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("""
+    global _db
+    _db = await _connect()
+    await _db.execute("""
         CREATE TABLE IF NOT EXISTS subscribed_users (
             user_id INTEGER PRIMARY KEY
         )
     """)
-    conn.commit()
-    conn.close()
 
-def add_subscribed_user(user_id):
+async def add_subscribed_user(user_id):
     """
     Inserts the user ID into the subscribed_users table (if not already present).
     """
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("INSERT OR IGNORE INTO subscribed_users (user_id) VALUES (?)", (user_id,))
-    conn.commit()
-    conn.close()
+    async with _db_write_lock:
+        await _db.execute("INSERT OR IGNORE INTO subscribed_users (user_id) VALUES (?)", (user_id,))
+        SUBSCRIBERS.add(user_id)
 
-def remove_subscribed_user(user_id):
+async def bulk_add_subscribed_users(user_ids):
+    """
+    Inserts many user IDs in a single transaction (one commit instead of one per row).
+    """
+    user_ids = list(user_ids)
+    async with _db_write_lock:
+        await _db.execute("BEGIN")
+        try:
+            await _db.executemany(
+                "INSERT OR IGNORE INTO subscribed_users (user_id) VALUES (?)",
+                ((user_id,) for user_id in user_ids)
+            )
+            await _db.execute("COMMIT")
+        except Exception:
+            # Never leave a transaction open on the shared autocommit connection. SQLite
+            # may already have rolled back (e.g. SQLITE_FULL); a second ROLLBACK would
+            # raise and mask the original error.
+            if _db.in_transaction:
+                await _db.execute("ROLLBACK")
+            raise
+        SUBSCRIBERS.update(user_ids)
+
+async def remove_subscribed_user(user_id):
     """
     Removes the user ID from the subscribed_users table.
     """
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM subscribed_users WHERE user_id = ?", (user_id,))
-    conn.commit()
-    conn.close()
+    async with _db_write_lock:
+        await _db.execute("DELETE FROM subscribed_users WHERE user_id = ?", (user_id,))
+        SUBSCRIBERS.discard(user_id)
 
 def is_user_subscribed(user_id):
     """
     Checks if a user is already subscribed.
     """
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT 1 FROM subscribed_users WHERE user_id = ?", (user_id,))
-    row = cursor.fetchone()
-    conn.close()
-    return row is not None
+    return user_id in SUBSCRIBERS
 
-def get_all_subscribed_users():
+async def get_all_subscribed_users():
     """
     Retrieves all subscribed user IDs from the database.
     """
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT user_id FROM subscribed_users")
-    rows = cursor.fetchall()
-    conn.close()
+    rows = await _db.execute_fetchall("SELECT user_id FROM subscribed_users")
     return [row[0] for row in rows]
 
-# Initialize the SQLite database/table
-init_db()
-
 # -----------------------------
 # 4. Define "Call" Message Filtering Criteria
 # -----------------------------
-# Updated Regex: Matches "XAUUSD buy", "XAUUSD sell", or any message with "buy" or "sell" (case-insensitive)
-CALL_PATTERN = re.compile(r'\b(XAUUSD.*(?:buy|sell)|(?:buy|sell))\b', re.IGNORECASE)
+# Matches "XAUUSD buy", "XAUUSD sell", or any message with "buy" or "sell" (case-insensitive).
+# Split into two patterns so the common case is a linear-time literal search and the
+# backtracking "XAUUSD.*" branch only runs on the rare messages the first one misses.
+# (?s) lets "XAUUSD" and the side sit on different lines of a multi-line post.
+# Inline flags keep the patterns valid for both re2 and the stdlib engine.
+SIDE_PATTERN = regex_engine.compile(r'(?i)\b(?:buy|sell)\b')
+XAUUSD_CALL_PATTERN = regex_engine.compile(r'(?is)\bXAUUSD.*?(?:buy|sell)\b')
+# Bound once so the per-message check skips the attribute lookup
+_side_search = SIDE_PATTERN.search
+_xauusd_call_search = XAUUSD_CALL_PATTERN.search
+
+def is_call_message(message_text):
+    """
+    Returns True if the message looks like a trading call.
+    Every match needs a literal "buy" or "sell", so a plain substring
+    check rejects most channel chatter before the regex engine runs.
+    """
+    lowered = message_text.lower()
+    if 'buy' not in lowered and 'sell' not in lowered:
+        return False
+    if _side_search(message_text):
+        return True
+    # e.g. "XAUUSDsell", where "sell" is not a standalone word
+    return 'xauusd' in lowered and _xauusd_call_search(message_text) is not None
 
 # -----------------------------
 # 5. Initialize Telegram Clients
@@ -131,76 +258,172 @@ os.makedirs("sessions", exist_ok=True)
 USER_SESSION = os.path.join("sessions", "telegram_monitor_text_only_user_session")
 BOT_SESSION = os.path.join("sessions", "telegram_monitor_text_only_bot_session")
 
-user_client = TelegramClient(USER_SESSION, int(API_ID), API_HASH)
-bot_client = TelegramClient(BOT_SESSION, int(API_ID), API_HASH)
+# Telethon uses cryptg's C implementation of AES when it is installed
+if cryptg is not None:
+    logger.info("🔐 cryptg found; using C-accelerated MTProto encryption.")
+else:
+    logger.warning("⚠️ cryptg not installed; falling back to pure-Python encryption (pip install cryptg).")
+
+# Abridged TCP has the smallest per-packet framing of Telethon's transports
+user_client = TelegramClient(USER_SESSION, int(API_ID), API_HASH, connection=ConnectionTcpAbridged)
+bot_client = TelegramClient(BOT_SESSION, int(API_ID), API_HASH, connection=ConnectionTcpAbridged)
 
 # -----------------------------
 # 6. Helper Functions
 # -----------------------------
+# Display names rarely change, so cache them per chat and refresh hourly to pick up renames
+CHANNEL_NAME_TTL = 3600  # seconds
+_channel_name_cache = {}  # key: chat_id, value: (cached_at, display name)
+
 def get_channel_display_name(event):
     """
     Returns a formatted display name for the channel from which the message originated.
     """
     try:
         chat = event.chat
-        if hasattr(chat, 'title') and chat.title:
-            return f"**{chat.title}**"
-        elif hasattr(chat, 'username') and chat.username:
-            return f"@{chat.username}"
+        now = time.monotonic()
+        cached = _channel_name_cache.get(chat.id)
+        if cached is not None and now - cached[0] < CHANNEL_NAME_TTL:
+            return cached[1]
+
+        title = getattr(chat, 'title', None)
+        username = getattr(chat, 'username', None)
+        if title:
+            name = title
+        elif username:
+            name = f"@{username}"
         else:
-            return f"Channel ID {chat.id}"
+            name = f"Channel ID {chat.id}"
+        _channel_name_cache[chat.id] = (now, name)
+        return name
     except Exception as e:
-        logger.error(f"❌ Error retrieving channel display name: {e}")
+        logger.error("❌ Error retrieving channel display name: %s", e)
         return "Unknown Channel"
 
-def escape_html(text):
+# Escapes HTML special characters in the text. Quotes are left alone: they only
+# need escaping inside attribute values, which we never build. A partial avoids
+# an extra Python-level frame per call.
+escape_html = partial(html.escape, quote=False)
+
+GOLD_API_URL = "https://www.goldapi.io/api/XAU/USD"
+
+# Shared async HTTP client, created in main() so TCP/TLS connections are pooled
+_http = None
+
+# Last successful price, shared by the burst of taps that follows a broadcast
+PRICE_CACHE_TTL = 5.0  # seconds
+_PRICE_CACHE = {"ts": 0.0, "price": None, "inflight": None}
+
+async def fetch_xauusd_price():
+    """
+    Returns the XAUUSD price, fetching it from the Gold API at most once per
+    PRICE_CACHE_TTL. Concurrent callers share a single in-flight request and
+    its result, including a failure.
     """
-    Escapes HTML special characters in the text.
+    price = _PRICE_CACHE["price"]
+    if price is not None and time.monotonic() - _PRICE_CACHE["ts"] < PRICE_CACHE_TTL:
+        return price
+
+    refresh = _PRICE_CACHE["inflight"]
+    if refresh is None:
+        refresh = asyncio.ensure_future(_refresh_xauusd_price())
+        _PRICE_CACHE["inflight"] = refresh
+    # Shielded so one caller's cancellation doesn't cancel the fetch for the others
+    return await asyncio.shield(refresh)
+
+async def _refresh_xauusd_price():
     """
-    return html.escape(text)
+    Fetches a fresh price and stores it in _PRICE_CACHE if the fetch succeeded.
+    """
+    try:
+        price = await request_xauusd_price()
+        if price is not None:
+            _PRICE_CACHE["price"] = price
+            _PRICE_CACHE["ts"] = time.monotonic()
+        return price
+    finally:
+        _PRICE_CACHE["inflight"] = None
 
-def fetch_xauusd_price():
+async def request_xauusd_price():
     """
     Fetches the live price of XAUUSD (gold vs USD) using the Gold API.
     """
-    api_key = os.getenv('GOLD_API_KEY')
-    url = "https://www.goldapi.io/api/XAU/USD"
-    headers = {
-        "x-access-token": api_key,
-        "Content-Type": "application/json"
-    }
-    
     try:
-        response = requests.get(url, headers=headers)
+        response = await _http.get(GOLD_API_URL)
         response.raise_for_status()
 
         data = response.json()
-        price = data.get("price")
+        price = data.get("price") if isinstance(data, dict) else None
         if price is not None:
-            logger.info(f"💰 Current XAUUSD Price: {price}")
+            logger.info("💰 Current XAUUSD Price: %s", price)
             return price
         else:
             logger.error("❌ Failed to retrieve price from the Gold API response.")
             return None
-    except requests.exceptions.RequestException as e:
-        logger.error(f"❌ Error fetching XAUUSD price: {e}")
+    except (httpx.HTTPError, ValueError) as e:
+        # ValueError covers a non-JSON body, e.g. an HTML error page served with 200
+        logger.error("❌ Error fetching XAUUSD price: %s", e)
         return None
 
+# Names of forward sources, so repeat forwards from the same source skip the RPC
+MAX_CACHED_FORWARD_NAMES = 2_000
+FORWARD_NAME_TIMEOUT = 1.0  # seconds; a slow lookup must not hold up the broadcast
+_forward_name_cache = OrderedDict()  # key: peer ID, value: display name
+
+async def resolve_forward_name(from_id):
+    """
+    Returns the display name of a forward source, or None if it can't be resolved.
+    Resolved names are cached (LRU); timeouts, errors and entity types without a
+    usable name (e.g. a basic Chat) are not cached and are retried next time.
+    """
+    peer_id = get_peer_id(from_id)
+    if peer_id in _forward_name_cache:
+        _forward_name_cache.move_to_end(peer_id)
+        return _forward_name_cache[peer_id]
+
+    try:
+        from_entity = await asyncio.wait_for(
+            user_client.get_entity(from_id),
+            timeout=FORWARD_NAME_TIMEOUT
+        )
+    except Exception:
+        return None
+
+    fwd_name = None
+    if isinstance(from_entity, Channel):
+        fwd_name = from_entity.title or "Unknown Channel"
+    elif isinstance(from_entity, User):
+        # Could be a user; prefer first_name, fallback to username
+        if from_entity.first_name:
+            fwd_name = from_entity.first_name
+            if from_entity.last_name:
+                fwd_name += " " + from_entity.last_name
+        else:
+            fwd_name = "Unknown User"
+
+    if fwd_name is None:
+        return None
+
+    _forward_name_cache[peer_id] = fwd_name
+    if len(_forward_name_cache) > MAX_CACHED_FORWARD_NAMES:
+        _forward_name_cache.popitem(last=False)
+    return fwd_name
+
 async def build_forward_text(event, message_text, is_edit=False):
     """
-    Builds the text that will be forwarded to subscribers, including:
+    Builds the HTML text that will be forwarded to subscribers, including:
       - The channel display name where the message originated.
       - If the message is forwarded from someone else, add "Forwarded from <Name>".
       - If the message is an edit, indicates it was edited.
     """
     escaped_message_text = escape_html(message_text)
-    channel_name = get_channel_display_name(event)
+    channel_name = escape_html(get_channel_display_name(event))
     forward_text = ""
 
     if is_edit:
-        forward_text += f"🔄 **Edited Signal in {channel_name}:**\n\n{escaped_message_text}"
+        forward_text += f"🔄 <b>Edited Signal in {channel_name}:</b>\n\n{escaped_message_text}"
     else:
-        forward_text += f"🔔 **New Signal in {channel_name}:**\n\n{escaped_message_text}"
+        forward_text += f"🔔 <b>New Signal in {channel_name}:</b>\n\n{escaped_message_text}"
 
     # If the message was forwarded, determine the original sender/channel if possible.
     fwd_info = event.message.fwd_from
@@ -211,65 +434,141 @@ async def build_forward_text(event, message_text, is_edit=False):
             # If the forward info has a textual name only
             fwd_name = fwd_info.from_name
         elif fwd_info.from_id:
-            try:
-                from_entity = await user_client.get_entity(fwd_info.from_id)
-                if isinstance(from_entity, Channel):
-                    fwd_name = from_entity.title or "Unknown Channel"
-                elif isinstance(from_entity, User):
-                    # Could be a user; prefer first_name, fallback to username
-                    if from_entity.first_name:
-                        fwd_name = from_entity.first_name
-                        if from_entity.last_name:
-                            fwd_name += " " + from_entity.last_name
-                    else:
-                        fwd_name = "Unknown User"
-            except Exception:
-                fwd_name = "Unknown"
+            fwd_name = await resolve_forward_name(fwd_info.from_id)
 
         if not fwd_name:
             # If we couldn't fetch from_name or entity
             fwd_name = "Unknown"
 
-        forward_text += f"\n\n*Forwarded from {escape_html(fwd_name)}.*"
+        forward_text += f"\n\n<i>Forwarded from {escape_html(fwd_name)}.</i>"
 
     return forward_text
 
-async def forward_to_subscribers(bot_client, forward_text):
+async def resolve_target_channels(user_client):
     """
-    Forwards the given text (with inline buttons) to all subscribed users.
+    Resolves every channel in TARGET_CHANNELS once so Telethon's entity cache
+    is warm before the first message arrives, and reports misconfigured ones.
+    The warm-up is best-effort: failures are logged and startup continues.
     """
-    buttons = [
-        [
-            Button.inline("Get XAUUSD Price", b"get_xauusd_price"),
-            Button.inline("Unsubscribe", b"unsubscribe_me")
-        ]
+    for channel in TARGET_CHANNELS:
+        try:
+            await user_client.get_input_entity(channel)
+        except (UsernameNotOccupiedError, PeerIdInvalidError, ValueError) as e:
+            logger.error("❌ Could not resolve target channel %s: %s", channel, e)
+        except RPCError as e:
+            # e.g. a private channel or a FloodWait on ResolveUsernameRequest
+            logger.error("❌ RPC Error while resolving target channel %s: %s", channel, e)
+
+# Subscribers resolved to InputPeerUser once, so sends skip entity resolution
+PEER_CACHE = {}  # key: user_id, value: InputPeerUser
+
+async def cache_user_peers(bot_client, user_ids):
+    """
+    Resolves the given user IDs to input peers and stores them in PEER_CACHE.
+    """
+    for user_id in user_ids:
+        try:
+            PEER_CACHE[user_id] = await bot_client.get_input_entity(user_id)
+        except Exception as e:
+            logger.error("❌ Error resolving peer for user ID %s: %s", user_id, e)
+
+# Caps concurrent sends to stay under Telegram's ~30 messages/s bot limit
+MAX_CONCURRENT_SENDS = 20
+_send_semaphore = asyncio.Semaphore(MAX_CONCURRENT_SENDS)
+# Longest flood wait worth retrying a send after; beyond that the signal is stale
+MAX_FLOOD_RETRY_WAIT = 120  # seconds
+
+# Inline buttons attached to every forwarded signal; built once, never mutated
+SIGNAL_BUTTONS = [
+    [
+        Button.inline("Get XAUUSD Price", b"get_xauusd_price"),
+        Button.inline("Unsubscribe", b"unsubscribe_me")
     ]
+]
+# Pre-converted to the TL ReplyInlineMarkup so send_message() passes it through as-is
+SIGNAL_REPLY_MARKUP = bot_client.build_reply_markup(SIGNAL_BUTTONS)
 
-    subscribed_users = get_all_subscribed_users()
+async def forward_to_subscribers(bot_client, forward_text):
+    """
+    Forwards the given text (with inline buttons) to all subscribed users.
+    """
+    # Snapshot so subscribe/unsubscribe during the fan-out can't shift the zip below
+    subscribed_users = list(SUBSCRIBERS)
     if not subscribed_users:
         logger.info("No subscribed users to forward this signal to.")
         return
 
-    for user_id in subscribed_users:
+    # Bound once; these are looked up for every subscriber
+    send_message = bot_client.send_message
+    get_peer = PEER_CACHE.get
+    log_info = logger.info
+
+    def deliver(user_id):
+        return send_message(
+            entity=get_peer(user_id, user_id),
+            message=forward_text,
+            buttons=SIGNAL_REPLY_MARKUP,
+            parse_mode='html'
+        )
+
+    async def send(user_id):
         try:
-            await bot_client.send_message(
-                entity=user_id,
-                message=forward_text,
-                buttons=buttons
-            )
-            logger.info(f"📩 Forwarded signal to user ID {user_id}")
-        except Exception as e:
-            logger.error(f"❌ Error when forwarding to user ID {user_id}: {e}")
+            async with _send_semaphore:
+                await deliver(user_id)
+        except FloodWaitError as e:
+            # Telethon sleeps through short waits itself, so anything raised here is long;
+            # only retry if the signal would still be reasonably fresh.
+            if e.seconds > MAX_FLOOD_RETRY_WAIT:
+                logger.warning("⏳ Flood wait of %ss when forwarding to user ID %s; not retrying.", e.seconds, user_id)
+                raise
+            logger.warning("⏳ Flood wait of %ss when forwarding to user ID %s; retrying.", e.seconds, user_id)
+            # Sleep without holding a slot so the rest of the fan-out keeps going
+            await asyncio.sleep(e.seconds + 1)
+            async with _send_semaphore:
+                await deliver(user_id)
+
+    # Send to everyone concurrently instead of paying one round-trip per user
+    results = await asyncio.gather(
+        *map(send, subscribed_users),
+        return_exceptions=True
+    )
+    for user_id, result in zip(subscribed_users, results):
+        if isinstance(result, Exception):
+            logger.error("❌ Error when forwarding to user ID %s: %s", user_id, result)
+        else:
+            log_info("📩 Forwarded signal to user ID %s", user_id)
 
 # -----------------------------
 # 7. Keep Track of Original "Call" Text to Detect Real Edits
 # -----------------------------
-matched_call_texts = {}  # key: (chat_id, msg_id), value: original message text
+# Bounded LRU: Telegram only allows edits for a limited time, so old entries are dead weight
+MAX_TRACKED_CALLS = 10_000
+matched_call_texts = OrderedDict()  # key: call_key(chat_id, msg_id), value: stripped message text
+
+def call_key(chat_id, msg_id):
+    """
+    Packs (chat_id, msg_id) into one int key for matched_call_texts: int keys
+    hash faster than tuples and need no allocation. Message IDs are 32-bit and
+    the shift keeps negative chat IDs distinct.
+    """
+    return (chat_id << 32) | msg_id
+
+def remember_call_text(key, message_text):
+    """
+    Stores the stripped text of a matched call, evicting the least recently used
+    entry once more than MAX_TRACKED_CALLS are tracked.
+    """
+    matched_call_texts[key] = message_text.strip()
+    matched_call_texts.move_to_end(key)
+    if len(matched_call_texts) > MAX_TRACKED_CALLS:
+        matched_call_texts.popitem(last=False)
 
 # -----------------------------
 # 8. Main Async Function
 # -----------------------------
 async def main():
+    global _http
+
     # Start the user client
     try:
         await user_client.start()
@@ -277,132 +576,188 @@ async def main():
         logger.error("❌ Two-Step Verification is enabled for the user account.")
         return
     except RPCError as e:
-        logger.error(f"❌ RPC Error during user client start: {e}")
+        logger.error("❌ RPC Error during user client start: %s", e)
         return
 
     # Start the bot client
     try:
         await bot_client.start(bot_token=BOT_TOKEN)
     except RPCError as e:
-        logger.error(f"❌ RPC Error during bot client start: {e}")
+        logger.error("❌ RPC Error during bot client start: %s", e)
         return
 
-    logger.info("✅ Bot is running and monitoring **call** messages...")
-
-    # -----------------------------
-    # Bot Command Handler: /start
-    # -----------------------------
-    @bot_client.on(events.NewMessage(pattern=r'^/start$'))
-    async def start_handler(event):
-        user_id = event.sender_id
-        if not is_user_subscribed(user_id):
-            add_subscribed_user(user_id)
-            await event.respond("✅ You have been subscribed to gold signals.")
-            logger.info(f"User {user_id} subscribed via /start.")
-        else:
-            await event.respond("You are already subscribed to gold signals.")
-
-    # -----------------------------
-    # Inline Button Callback Handler
-    # -----------------------------
-    @bot_client.on(events.CallbackQuery)
-    async def callback_query_handler(event):
-        data = event.data.decode('utf-8')
-
-        # 1) "Get XAUUSD Price"
-        if data == "get_xauusd_price":
-            price = fetch_xauusd_price()
-            if price is not None:
-                await event.answer(
-                    f"💰 Current XAUUSD Price: {price} USD",
-                    alert=True
-                )
-            else:
-                await event.answer(
-                    "❌ Error fetching XAUUSD price. Please try again later.",
-                    alert=True
-                )
-        
-        # 2) "Unsubscribe"
-        elif data == "unsubscribe_me":
+    flush_task = None
+    try:
+        # The Gold API headers never change, so set them once on the client
+        _http = httpx.AsyncClient(
+            timeout=5.0,
+            headers={
+                "x-access-token": GOLD_API_KEY,
+                "Content-Type": "application/json"
+            }
+        )
+
+        # Initialize the SQLite database/table and load the subscriber mirror
+        await init_db()
+        SUBSCRIBERS.update(await get_all_subscribed_users())
+
+        await resolve_target_channels(user_client)
+
+        # Warm the peer cache so the first broadcast doesn't resolve every subscriber
+        await cache_user_peers(bot_client, SUBSCRIBERS)
+
+        logger.info("✅ Bot is running and monitoring **call** messages...")
+
+        # -----------------------------
+        # Bot Command Handler: /start
+        # -----------------------------
+        @bot_client.on(events.NewMessage(pattern=r'^/start$'))
+        async def start_handler(event):
             user_id = event.sender_id
-            if is_user_subscribed(user_id):
-                remove_subscribed_user(user_id)
-                await event.answer("You have been unsubscribed from gold signals.", alert=True)
-                logger.info(f"User {user_id} unsubscribed via inline button.")
+            if not is_user_subscribed(user_id):
+                await add_subscribed_user(user_id)
+                peer = await event.get_input_sender()
+                if peer is not None:
+                    PEER_CACHE[user_id] = peer
+                await event.respond("✅ You have been subscribed to gold signals.")
+                logger.info("User %s subscribed via /start.", user_id)
             else:
-                await event.answer("You are not currently subscribed.", alert=True)
-
-    # -----------------------------
-    # User Client: Forward Matching Messages (New)
-    # -----------------------------
-    @user_client.on(events.NewMessage(chats=TARGET_CHANNELS))
-    async def on_new_message(event):
-        message_text = event.message.message or ""
-        if not message_text.strip():
-            logger.info(f"📄 Skipped forwarding an empty or non-text message from {get_channel_display_name(event)}.")
-            return
-
-        if not CALL_PATTERN.search(message_text):
-            logger.info(f"📄 Skipped forwarding a non-call message from {get_channel_display_name(event)}: {message_text}")
-            return
-
-        # Store the message text in matched_call_texts for comparison on edits
-        matched_call_texts[(event.chat_id, event.message.id)] = message_text
-
-        # Build forward text
-        forward_text = await build_forward_text(event, message_text, is_edit=False)
-        # Forward to subscribers
-        await forward_to_subscribers(bot_client, forward_text)
-
-        logger.info(f"📩 Forwarded signal to all subscribers: {message_text}")
-
-    # -----------------------------
-    # Handle Edited Messages
-    # -----------------------------
-    @user_client.on(events.MessageEdited(chats=TARGET_CHANNELS))
-    async def on_edited_message(event):
-        """
-        Forward only if:
-          - It was previously a matched 'call' (exists in matched_call_texts)
-          - The text has actually changed
-        """
-        key = (event.chat_id, event.message.id)
-        if key not in matched_call_texts:
-            # Not a matched call to begin with, ignore
-            return
-
-        old_text = matched_call_texts[key]
-        new_text = event.message.message or ""
-
-        # Check if the text has actually changed
-        if new_text.strip() == old_text.strip():
-            logger.info(f"✏️ Ignored an edit where the text didn't change: {new_text}")
-            return
-
-        # Update the stored text so future edits compare against the new text
-        matched_call_texts[key] = new_text
-
-        # Build the forward text indicating it's an edit
-        forward_text = await build_forward_text(event, new_text, is_edit=True)
-        # Forward to subscribers
-        await forward_to_subscribers(bot_client, forward_text)
-
-        logger.info(f"✏️ Forwarded edited signal to all subscribers: {new_text}")
-
-    # Keep both clients running until manually stopped
-    await asyncio.gather(
-        user_client.run_until_disconnected(),
-        bot_client.run_until_disconnected()
-    )
+                await event.respond("You are already subscribed to gold signals.")
+
+        # -----------------------------
+        # Inline Button Callback Handler
+        # -----------------------------
+        @bot_client.on(events.CallbackQuery)
+        async def callback_query_handler(event):
+            data = event.data.decode('utf-8')
+
+            # 1) "Get XAUUSD Price"
+            if data == "get_xauusd_price":
+                price = await fetch_xauusd_price()
+                if price is not None:
+                    await event.answer(
+                        f"💰 Current XAUUSD Price: {price} USD",
+                        alert=True
+                    )
+                else:
+                    await event.answer(
+                        "❌ Error fetching XAUUSD price. Please try again later.",
+                        alert=True
+                    )
+        
+            # 2) "Unsubscribe"
+            elif data == "unsubscribe_me":
+                user_id = event.sender_id
+                if is_user_subscribed(user_id):
+                    await remove_subscribed_user(user_id)
+                    PEER_CACHE.pop(user_id, None)
+                    await event.answer("You have been unsubscribed from gold signals.", alert=True)
+                    logger.info("User %s unsubscribed via inline button.", user_id)
+                else:
+                    await event.answer("You are not currently subscribed.", alert=True)
+
+        # -----------------------------
+        # User Client: Forward Matching Messages (New)
+        # -----------------------------
+        @user_client.on(events.NewMessage(chats=TARGET_CHANNELS))
+        async def on_new_message(event):
+            # Nobody to notify: skip the filtering work entirely
+            if not SUBSCRIBERS:
+                return
+
+            message = event.message
+            message_text = message.message or ""
+            if not message_text or message_text.isspace():
+                if logger.isEnabledFor(logging.INFO):
+                    logger.info("📄 Skipped forwarding an empty or non-text message from %s.", get_channel_display_name(event))
+                return
+
+            if not is_call_message(message_text):
+                if logger.isEnabledFor(logging.INFO):
+                    logger.info("📄 Skipped forwarding a non-call message from %s: %s", get_channel_display_name(event), message_text)
+                return
+
+            # Store the message text in matched_call_texts for comparison on edits
+            remember_call_text(call_key(event.chat_id, message.id), message_text)
+
+            # Build forward text
+            forward_text = await build_forward_text(event, message_text, is_edit=False)
+            # Forward to subscribers
+            await forward_to_subscribers(bot_client, forward_text)
+
+            logger.info("📩 Forwarded signal to all subscribers: %s", message_text)
+
+        # -----------------------------
+        # Handle Edited Messages
+        # -----------------------------
+        # The func filter drops edits of untracked messages inside Telethon's dispatcher,
+        # before the handler coroutine is even created.
+        @user_client.on(events.MessageEdited(
+            chats=TARGET_CHANNELS,
+            func=lambda e: call_key(e.chat_id, e.message.id) in matched_call_texts
+        ))
+        async def on_edited_message(event):
+            """
+            Forward only if:
+              - It was previously a matched 'call' (exists in matched_call_texts)
+              - The text has actually changed
+            """
+            key = call_key(event.chat_id, event.message.id)
+            old_text = matched_call_texts.get(key)
+            if old_text is None:
+                # Evicted since the dispatcher's check, ignore
+                return
+
+            matched_call_texts.move_to_end(key)
+            new_text = event.message.message or ""
+
+            # Check if the text has actually changed (the stored text is already stripped)
+            if new_text.strip() == old_text:
+                logger.info("✏️ Ignored an edit where the text didn't change: %s", new_text)
+                return
+
+            # Update the stored text so future edits compare against the new text
+            remember_call_text(key, new_text)
+
+            # Build the forward text indicating it's an edit
+            forward_text = await build_forward_text(event, new_text, is_edit=True)
+            # Forward to subscribers
+            await forward_to_subscribers(bot_client, forward_text)
+
+            logger.info("✏️ Forwarded edited signal to all subscribers: %s", new_text)
+
+        flush_task = asyncio.create_task(flush_logs_periodically())
+
+        # Keep both clients running until manually stopped
+        await asyncio.gather(
+            user_client.run_until_disconnected(),
+            bot_client.run_until_disconnected()
+        )
+    finally:
+        # Always release these: aiosqlite's non-daemon worker thread would
+        # otherwise keep the process alive after a startup failure or Ctrl-C.
+        if flush_task is not None:
+            flush_task.cancel()
+        if _http is not None:
+            await _http.aclose()
+        if _db is not None:
+            await _db.close()
 
 # -----------------------------
 # 9. Run the Script
 # -----------------------------
 if __name__ == '__main__':
+    # uvloop is a faster libuv-based event loop; it doesn't support Windows
+    if sys.platform != 'win32':
+        try:
+            import uvloop
+            uvloop.install()
+        except ImportError:
+            pass
+
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("\n🔒 Bot stopped by user.")
     except Exception as e:
-        logger.error(f"\n❌ An unexpected error occurred: {e}")
+        logger.error("\n❌ An unexpected error occurred: %s", e)